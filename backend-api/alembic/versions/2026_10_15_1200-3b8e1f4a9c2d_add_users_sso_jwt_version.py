@@ -0,0 +1,35 @@
+"""add users.sso_jwt_version
+
+Revision ID: 3b8e1f4a9c2d
+Revises: 
+Create Date: 2026-10-15 12:00:00
+
+Databases created before this revision have the tables from
+Base.metadata.create_all() and no alembic_version row; the statements use
+IF [NOT] EXISTS so the revision also applies cleanly to a database that
+init_db() already created with the current models, or not created yet.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3b8e1f4a9c2d"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE IF EXISTS users "
+        "ADD COLUMN IF NOT EXISTS sso_jwt_version BIGINT NOT NULL DEFAULT 0"
+    )
+    # init_db() may already have created the column as INTEGER
+    op.execute(
+        "ALTER TABLE IF EXISTS users "
+        "ALTER COLUMN sso_jwt_version TYPE BIGINT"
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE IF EXISTS users DROP COLUMN IF EXISTS sso_jwt_version")
@@ -0,0 +1,92 @@
+"""move audit log details into a JSONB column and add lookup indexes
+
+Revision ID: 7c4d2a9e1b05
+Revises: 3b8e1f4a9c2d
+Create Date: 2026-10-15 12:10:00
+
+vm_name, error_message and ip_address are copied into audit_logs.details
+and then dropped. Skipped where init_db() already created the new layout.
+
+Also creates the indexes declared on VMAssignment and AuditLog, which
+create_all() never adds to existing tables.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7c4d2a9e1b05"
+down_revision = "3b8e1f4a9c2d"
+branch_labels = None
+depends_on = None
+
+_MOVED_COLUMNS = ("vm_name", "error_message", "ip_address")
+
+# (name, table, columns, unique)
+_INDEXES = (
+    ("ix_vmassign_user_vm", "vm_assignments", "user_id, vm_id", True),
+    ("ix_audit_user_ts", "audit_logs", "user_id, timestamp", False),
+    ("ix_audit_vm_ts", "audit_logs", "vm_id, timestamp", False),
+    ("ix_audit_ts", "audit_logs", "timestamp", False),
+)
+
+
+def _audit_columns() -> set:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("audit_logs"):
+        return set()
+    return {column["name"] for column in inspector.get_columns("audit_logs")}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, unique in _INDEXES:
+        if inspector.has_table(table):
+            op.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "
+                f"{name} ON {table} ({columns})"
+            )
+    
+    columns = _audit_columns()
+    if not columns:
+        return  # init_db() creates the table with the new layout
+    
+    op.execute(
+        "ALTER TABLE audit_logs "
+        "ADD COLUMN IF NOT EXISTS details JSONB NOT NULL DEFAULT '{}'"
+    )
+    
+    if "vm_name" in columns:
+        op.execute(
+            "UPDATE audit_logs SET details = jsonb_strip_nulls(jsonb_build_object("
+            "'vm_name', vm_name, "
+            "'error_message', error_message, "
+            "'ip_address', ip_address))"
+        )
+        for column in _MOVED_COLUMNS:
+            op.drop_column("audit_logs", column)
+    
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_audit_details "
+        "ON audit_logs USING gin (details)"
+    )
+
+
+def downgrade() -> None:
+    for name, _, _, _ in _INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    
+    columns = _audit_columns()
+    if "details" not in columns:
+        return
+    
+    for column in _MOVED_COLUMNS:
+        op.add_column("audit_logs", sa.Column(column, sa.String(), nullable=True))
+    op.execute(
+        "UPDATE audit_logs SET "
+        "vm_name = details->>'vm_name', "
+        "error_message = details->>'error_message', "
+        "ip_address = details->>'ip_address'"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_audit_details")
+    op.drop_column("audit_logs", "details")
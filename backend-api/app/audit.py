@@ -0,0 +1,121 @@
+"""
+Batched audit log writer
+
+Handlers enqueue audit records and return immediately; a background task
+inserts them in batches, one INSERT and commit per batch.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from sqlalchemy import insert
+import asyncio
+import logging
+
+from app.database import AsyncSessionLocal
+from app.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many records are pending or this many seconds have passed
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.1
+
+audit_queue: "asyncio.Queue[Optional[Dict]]" = asyncio.Queue()
+
+
+def record_audit(
+    *,
+    user_id: Optional[str],
+    user_email: str,
+    action: str,
+    vm_id: int,
+    success: bool,
+    **details: Any
+):
+    """
+    Queue an audit log record
+    
+    Args:
+        user_id: Acting user's ID
+        user_email: Acting user's email
+        action: Action name (start, stop, ...)
+        vm_id: Proxmox VM ID
+        success: Whether the action succeeded
+        **details: Action-specific values stored in the details column
+            (e.g. vm_name, error_message, ip_address); None values are dropped
+    """
+    audit_queue.put_nowait({
+        "user_id": user_id,
+        "user_email": user_email,
+        "action": action,
+        "vm_id": vm_id,
+        "success": success,
+        "details": {key: value for key, value in details.items() if value is not None},
+        # Stamp now; the row may be written a little later
+        "timestamp": datetime.now(timezone.utc),
+    })
+
+
+async def _insert_rows(rows: List[Dict]):
+    """Insert audit records in one statement and transaction"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(AuditLog), rows)
+        await session.commit()
+
+
+async def _write_batch(rows: List[Dict]):
+    """
+    Insert a batch of audit records
+    
+    If the batch is rejected (e.g. a foreign key violation because the user
+    was deleted before the flush), it is split in halves and retried, so
+    only the records that fail on their own are dropped.
+    """
+    try:
+        await _insert_rows(rows)
+    except Exception as e:
+        if len(rows) == 1:
+            logger.error("Dropped audit log record %s: %s", rows[0], e)
+            return
+        logger.warning("Failed to write %s audit log records, retrying in halves: %s", len(rows), e)
+        middle = len(rows) // 2
+        await _write_batch(rows[:middle])
+        await _write_batch(rows[middle:])
+
+
+async def audit_writer():
+    """
+    Drain the audit queue into the database until a None sentinel arrives
+    
+    Started from the app lifespan; see stop_audit_writer().
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await audit_queue.get()
+        if item is None:
+            return
+        
+        rows = [item]
+        stop = False
+        deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+        while len(rows) < AUDIT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(audit_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stop = True
+                break
+            rows.append(item)
+        
+        await _write_batch(rows)
+        if stop:
+            return
+
+
+async def stop_audit_writer(task: asyncio.Task):
+    """Flush pending records and stop the writer task"""
+    audit_queue.put_nowait(None)
+    await task
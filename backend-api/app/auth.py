@@ -1,31 +1,148 @@
 """
 GoTrue authentication integration
 """
+import asyncio
+import hashlib
+import time
 import httpx
 import jwt
+from cachetools import TTLCache
+from dataclasses import dataclass
+from redis.exceptions import RedisError
 from typing import Optional, Dict
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam, exists
 import logging
 
 from app.config import settings
+from app.cache import redis
 from app.database import get_db
-from app.models import User
+from app.http_client import create_http_client
+from app.models import User, VMAssignment
 
 logger = logging.getLogger(__name__)
 
 # Security scheme
 security = HTTPBearer()
 
+# GoTrue endpoints, relative to the client's base_url
+_LOGIN_PATH = "/token?grant_type=password"
+_REFRESH_PATH = "/token?grant_type=refresh_token"
+_SIGNUP_PATH = "/signup"
+_USER_PATH = "/user"
+_RECOVER_PATH = "/recover"
+_HEALTH_PATH = "/health"
+
+# Empty signup metadata (never mutated)
+_EMPTY_DATA: Dict = {}
+
+# (id, email, is_admin, sso_jwt_version) rows of recently authenticated users
+_user_cache: TTLCache = TTLCache(maxsize=5000, ttl=30)
+
+# Hot statements are built once at import, with bind parameters for the
+# values, which saves constructing the expression on every request. (The
+# engine's compiled cache is keyed on statement structure, so it is hit
+# either way; this only skips the construction.)
+_USER_LOOKUP = select(
+    User.id, User.email, User.is_admin, User.sso_jwt_version
+).where(User.id == bindparam("uid"))
+
+# Whether a VM is assigned to a user; built once like _USER_LOOKUP
+_VM_ACCESS_CHECK = select(exists().where(
+    VMAssignment.user_id == bindparam("uid"),
+    VMAssignment.vm_id == bindparam("vid")
+))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Authenticated user as seen by request handlers"""
+    id: str
+    email: str
+    is_admin: bool
+    sso_jwt_version: int = 0
+
+
+def session_auth_time(payload: Dict) -> int:
+    """
+    When the session behind a token was authenticated (Unix time)
+    
+    GoTrue lists the sign-in methods in the "amr" claim with their times;
+    tokens from a refresh keep them, while their "iat" is the refresh time.
+    Falls back to "iat" for tokens without amr.
+    """
+    times = [
+        entry["timestamp"]
+        for entry in payload.get("amr") or ()
+        if isinstance(entry, dict) and isinstance(entry.get("timestamp"), int)
+    ]
+    return min(times) if times else payload.get("iat", 0)
+
+
+def invalidate_user_cache(user_id: str):
+    """Drop a user from the auth cache after their row changes"""
+    _user_cache.pop(user_id, None)
+
+
+# Seconds a VM access decision is cached in Redis
+VM_ACCESS_TTL = 60
+
+
+def _vm_access_key(user_id: str, vm_id: int) -> str:
+    return f"acl:{user_id}:{vm_id}"
+
+
+async def invalidate_vm_access(user_id: str, vm_id: int):
+    """Drop a cached VM access decision after an assignment changes"""
+    try:
+        await redis.delete(_vm_access_key(user_id, vm_id))
+    except RedisError as e:
+        logger.warning("Could not invalidate VM access cache: %s", e)
+
 
 class GoTrueClient:
     """GoTrue client for authentication operations"""
     
     def __init__(self):
         self.base_url = settings.gotrue_url
-        self.jwt_secret = settings.gotrue_jwt_secret
+        # Encoded once so jwt.decode doesn't re-encode the key per call
+        self.jwt_secret = settings.gotrue_jwt_secret.encode()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # Decoded token payloads keyed by a digest of the token
+        self._token_cache: TTLCache = TTLCache(maxsize=10000, ttl=300)
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """
+        Get the shared HTTP client, creating it on first use
+        
+        A single pooled client keeps connections to GoTrue alive between
+        requests instead of paying a new TCP/TLS handshake on every call.
+        """
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = create_http_client(self.base_url)
+        return self._client
+    
+    async def open(self):
+        """Create the shared HTTP client up front (called at app startup)"""
+        await self._get_client()
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def __aenter__(self):
+        await self._get_client()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
     
     async def login(self, email: str, password: str) -> Dict:
         """
@@ -38,27 +155,27 @@ class GoTrueClient:
         Returns:
             Dict with access_token and user info
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/token?grant_type=password",
-                    json={"email": email, "password": password}
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid credentials"
-                    )
-                
-                return response.json()
-                
-            except httpx.RequestError as e:
-                logger.error(f"GoTrue login request failed: {e}")
+        client = await self._get_client()
+        try:
+            response = await client.post(
+                _LOGIN_PATH,
+                json={"email": email, "password": password}
+            )
+            
+            if response.status_code != 200:
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Authentication service unavailable"
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid credentials"
                 )
+            
+            return response.json()
+            
+        except httpx.RequestError as e:
+            logger.error("GoTrue login request failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service unavailable"
+            )
     
     async def signup(self, email: str, password: str) -> Dict:
         """
@@ -71,32 +188,32 @@ class GoTrueClient:
         Returns:
             Dict with user info
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/signup",
-                    json={
-                        "email": email,
-                        "password": password,
-                        "data": {}  # Custom metadata
-                    }
-                )
-                
-                if response.status_code not in [200, 201]:
-                    error_msg = response.json().get("msg", "Signup failed")
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=error_msg
-                    )
-                
-                return response.json()
-                
-            except httpx.RequestError as e:
-                logger.error(f"GoTrue signup request failed: {e}")
+        client = await self._get_client()
+        try:
+            response = await client.post(
+                _SIGNUP_PATH,
+                json={
+                    "email": email,
+                    "password": password,
+                    "data": _EMPTY_DATA  # Custom metadata
+                }
+            )
+            
+            if response.status_code not in [200, 201]:
+                error_msg = response.json().get("msg", "Signup failed")
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Authentication service unavailable"
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=error_msg
                 )
+            
+            return response.json()
+            
+        except httpx.RequestError as e:
+            logger.error("GoTrue signup request failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service unavailable"
+            )
     
     async def verify_token(self, token: str) -> Dict:
         """
@@ -108,6 +225,23 @@ class GoTrueClient:
         Returns:
             Decoded token payload
         """
+        # Key on a digest so raw tokens are never held in memory
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        
+        payload = self._token_cache.get(key)
+        if payload is not None:
+            exp = payload.get("exp")
+            if exp is None or exp > time.time():
+                return payload
+            self._token_cache.pop(key, None)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired"
+            )
+        
+        # Decoding and caching happen without yielding to the event loop, so
+        # concurrent requests with the same token can't both miss: whichever
+        # runs second finds the entry. No in-flight map is needed.
         try:
             payload = jwt.decode(
                 token,
@@ -115,6 +249,7 @@ class GoTrueClient:
                 algorithms=["HS256"],
                 options={"verify_exp": True}
             )
+            self._token_cache[key] = payload
             return payload
         except jwt.ExpiredSignatureError:
             raise HTTPException(
@@ -137,27 +272,27 @@ class GoTrueClient:
         Returns:
             New access token and refresh token
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/token?grant_type=refresh_token",
-                    json={"refresh_token": refresh_token}
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Invalid refresh token"
-                    )
-                
-                return response.json()
-                
-            except httpx.RequestError as e:
-                logger.error(f"GoTrue refresh token request failed: {e}")
+        client = await self._get_client()
+        try:
+            response = await client.post(
+                _REFRESH_PATH,
+                json={"refresh_token": refresh_token}
+            )
+            
+            if response.status_code != 200:
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Authentication service unavailable"
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid refresh token"
                 )
+            
+            return response.json()
+            
+        except httpx.RequestError as e:
+            logger.error("GoTrue refresh token request failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service unavailable"
+            )
     
     async def change_password(self, access_token: str, new_password: str) -> Dict:
         """
@@ -170,28 +305,28 @@ class GoTrueClient:
         Returns:
             Success message
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.put(
-                    f"{self.base_url}/user",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    json={"password": new_password}
-                )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Password change failed"
-                    )
-                
-                return response.json()
-                
-            except httpx.RequestError as e:
-                logger.error(f"GoTrue password change failed: {e}")
+        client = await self._get_client()
+        try:
+            response = await client.put(
+                _USER_PATH,
+                headers={"Authorization": f"Bearer {access_token}"},
+                json={"password": new_password}
+            )
+            
+            if response.status_code != 200:
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Authentication service unavailable"
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Password change failed"
                 )
+            
+            return response.json()
+            
+        except httpx.RequestError as e:
+            logger.error("GoTrue password change failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service unavailable"
+            )
     
     async def request_password_reset(self, email: str) -> Dict:
         """
@@ -203,22 +338,22 @@ class GoTrueClient:
         Returns:
             Success message
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/recover",
-                    json={"email": email}
-                )
-                
-                # GoTrue returns 200 even if email doesn't exist (security)
-                return {"message": "Password reset email sent if account exists"}
-                
-            except httpx.RequestError as e:
-                logger.error(f"GoTrue password reset request failed: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Authentication service unavailable"
-                )
+        client = await self._get_client()
+        try:
+            response = await client.post(
+                _RECOVER_PATH,
+                json={"email": email}
+            )
+            
+            # GoTrue returns 200 even if email doesn't exist (security)
+            return {"message": "Password reset email sent if account exists"}
+            
+        except httpx.RequestError as e:
+            logger.error("GoTrue password reset request failed: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service unavailable"
+            )
     
     async def health_check(self) -> bool:
         """
@@ -227,13 +362,13 @@ class GoTrueClient:
         Returns:
             True if accessible, False otherwise
         """
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(f"{self.base_url}/health")
-                return response.status_code == 200
-            except Exception as e:
-                logger.error(f"GoTrue health check failed: {e}")
-                return False
+        client = await self._get_client()
+        try:
+            response = await client.get(_HEALTH_PATH)
+            return response.status_code == 200
+        except Exception as e:
+            logger.error("GoTrue health check failed: %s", e)
+            return False
 
 
 # Global GoTrue client
@@ -243,16 +378,21 @@ gotrue_client = GoTrueClient()
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
-) -> User:
+) -> CurrentUser:
     """
     Dependency to get current authenticated user
     
+    Only the columns needed for authorization are loaded, and the result is
+    cached per user for a short time. Tokens whose session was authenticated
+    at or before the user's sso_jwt_version are rejected as revoked, including
+    ones obtained later by refreshing such a session.
+    
     Args:
         credentials: HTTP Bearer token
         db: Database session
         
     Returns:
-        User object
+        CurrentUser object
     """
     token = credentials.credentials
     
@@ -267,24 +407,38 @@ async def get_current_user(
             detail="Invalid token payload"
         )
     
-    # Get user from database
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
-    user = result.scalar_one_or_none()
+    user = _user_cache.get(user_id)
+    if user is None:
+        # Get user from database
+        result = await db.execute(_USER_LOOKUP, {"uid": user_id})
+        row = result.one_or_none()
+        
+        if not row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found in database"
+            )
+        
+        user = CurrentUser(
+            id=row.id,
+            email=row.email,
+            is_admin=row.is_admin,
+            sso_jwt_version=row.sso_jwt_version
+        )
+        _user_cache[user_id] = user
     
-    if not user:
+    if session_auth_time(payload) <= user.sso_jwt_version:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in database"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
         )
     
     return user
 
 
 async def get_current_admin_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
     """
     Dependency to require admin privileges
     
@@ -292,7 +446,7 @@ async def get_current_admin_user(
         current_user: Current authenticated user
         
     Returns:
-        User object if admin
+        CurrentUser object if admin
     """
     if not current_user.is_admin:
         raise HTTPException(
@@ -301,3 +455,66 @@ async def get_current_admin_user(
         )
     
     return current_user
+
+
+async def user_can_control(user_id: str, vm_id: int, db: AsyncSession) -> bool:
+    """
+    Check whether a (non-admin) user is assigned a VM
+    
+    Decisions are cached in Redis for VM_ACCESS_TTL seconds; the database is
+    used directly if Redis is unavailable.
+    
+    Args:
+        user_id: User ID
+        vm_id: Proxmox VM ID
+        db: Database session
+        
+    Returns:
+        True if the VM is assigned to the user
+    """
+    key = _vm_access_key(user_id, vm_id)
+    try:
+        cached = await redis.get(key)
+        if cached is not None:
+            return cached == b"1"
+    except RedisError as e:
+        logger.warning("VM access cache unavailable: %s", e)
+    
+    allowed = bool(await db.scalar(_VM_ACCESS_CHECK, {"uid": user_id, "vid": vm_id}))
+    
+    try:
+        await redis.set(key, "1" if allowed else "0", ex=VM_ACCESS_TTL)
+    except RedisError as e:
+        logger.warning("VM access cache unavailable: %s", e)
+    
+    return allowed
+
+
+async def require_vm_access(
+    vm_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
+    """
+    Dependency to require control over a VM
+    
+    Admins can control every VM; other users only their assigned one.
+    
+    Args:
+        vm_id: Proxmox VM ID from the request path
+        current_user: Current authenticated user
+        db: Database session
+        
+    Returns:
+        CurrentUser object if allowed
+    """
+    if current_user.is_admin:
+        return current_user
+    
+    if not await user_can_control(current_user.id, vm_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have access to this VM"
+        )
+    
+    return current_user
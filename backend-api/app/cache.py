@@ -0,0 +1,163 @@
+"""
+Redis-backed response caching
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+import functools
+import logging
+import orjson
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared Redis connection pool
+redis = aioredis.from_url(settings.redis_url)
+
+# Prefix for response cache keys
+CACHE_PREFIX = "pc"
+
+# Cache namespaces, cleared when the data behind them changes
+VMS_NAMESPACE = "vms"
+ADMIN_NAMESPACE = "admin"
+
+# Number of users, kept in step with creates/deletes for the admin dashboard.
+# The TTL bounds drift from users added or removed outside the API.
+USER_COUNT_KEY = "stats:users"
+USER_COUNT_TTL = 3600
+
+# Adjust the counter only while it is set; a missing key means "recount"
+_adjust_if_set = redis.register_script(
+    "if redis.call('exists', KEYS[1]) == 1 then "
+    "return redis.call('incrby', KEYS[1], ARGV[1]) end"
+)
+
+
+def _version_key(namespace: str) -> str:
+    return f"{CACHE_PREFIX}:{namespace}:version"
+
+
+def response_cache_key(namespace: str, version: int, request: Request, user: Any) -> str:
+    """
+    Build a cache key that is unique per namespace version, path, query and user
+    
+    Admins and regular users see different data for the same path, so the
+    user's id and role are part of the key.
+    """
+    return (
+        f"{CACHE_PREFIX}:{namespace}:{version}:"
+        f"{request.url.path}?{request.url.query}:{user.id}:{user.is_admin}"
+    )
+
+
+def _json_response(body: bytes, expire: int) -> Response:
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"Cache-Control": f"max-age={expire}"},
+    )
+
+
+def cache_response(
+    expire: int,
+    namespace: str,
+    bypass: Optional[Callable[[Dict[str, Any]], bool]] = None
+):
+    """
+    Cache a JSON endpoint's responses in Redis for expire seconds
+    
+    The endpoint must take a request: Request parameter and the
+    authenticated user as current_user or current_admin. If Redis is
+    unavailable, responses are computed as if nothing were cached.
+    
+    Args:
+        expire: Seconds to keep a response
+        namespace: Namespace cleared by invalidate_vm_views()
+        bypass: Called with the endpoint's arguments; if it returns True the
+            cache is neither read nor written
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if bypass is not None and bypass(kwargs):
+                return await func(*args, **kwargs)
+            
+            request: Request = kwargs["request"]
+            user = kwargs.get("current_user") or kwargs.get("current_admin")
+            
+            key = None
+            try:
+                version = int(await redis.get(_version_key(namespace)) or 0)
+                key = response_cache_key(namespace, version, request, user)
+                cached = await redis.get(key)
+                if cached is not None:
+                    return _json_response(cached, expire)
+            except RedisError as e:
+                logger.warning("Response cache unavailable: %s", e)
+            
+            body = orjson.dumps(jsonable_encoder(await func(*args, **kwargs)))
+            
+            if key is not None:
+                try:
+                    await redis.set(key, body, ex=expire)
+                except RedisError as e:
+                    logger.warning("Response cache unavailable: %s", e)
+            
+            return _json_response(body, expire)
+        
+        return wrapper
+    
+    return decorator
+
+
+async def invalidate_vm_views():
+    """
+    Drop cached VM and admin dashboard responses after a change
+    
+    Bumps each namespace's version instead of deleting keys: entries under
+    the old version are never read again and expire on their own TTL, and
+    no keyspace scan is needed. Failures are logged; cached views then go
+    stale for at most their TTL.
+    """
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.incr(_version_key(VMS_NAMESPACE))
+            pipe.incr(_version_key(ADMIN_NAMESPACE))
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning("Could not invalidate cached VM views: %s", e)
+
+
+async def get_user_count() -> Optional[int]:
+    """Return the cached number of users, or None if it must be recounted"""
+    try:
+        value = await redis.get(USER_COUNT_KEY)
+    except RedisError as e:
+        logger.warning("User count lookup failed: %s", e)
+        return None
+    return int(value) if value is not None else None
+
+
+async def set_user_count(count: int):
+    """Seed the user counter after an exact count (keeps a newer value)"""
+    try:
+        await redis.set(USER_COUNT_KEY, count, ex=USER_COUNT_TTL, nx=True)
+    except RedisError as e:
+        logger.warning("User count update failed: %s", e)
+
+
+async def adjust_user_count(delta: int):
+    """Add delta to the user counter if it is currently set"""
+    try:
+        await _adjust_if_set(keys=[USER_COUNT_KEY], args=[delta])
+    except RedisError as e:
+        logger.warning("User count update failed: %s", e)
+        # Don't leave a wrong count behind; the next read recounts
+        try:
+            await redis.delete(USER_COUNT_KEY)
+        except RedisError:
+            pass
@@ -21,6 +21,15 @@ class Settings(BaseSettings):
     proxmox_token_value: str = "df52c07c-34b9-4b84-a695-02e64a49d97d"
     proxmox_verify_ssl: bool = False
     proxmox_node: str = "pve"
+    proxmox_refresh_interval: float = 5.0  # Seconds between background VM list refreshes
+    
+    # Redis (rate limiting and shared caches)
+    redis_url: str = "redis://localhost:6379/0"
+    
+    # Outbound HTTP connection pools (GoTrue and Proxmox)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_timeout: float = 10.0
     
     # GoTrue
     gotrue_url: str = "http://localhost:9999"
@@ -32,12 +41,16 @@ class Settings(BaseSettings):
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     api_reload: bool = True
+    api_workers: int = 1  # Production worker processes; match the container's CPU limit
+    forwarded_allow_ips: str = "127.0.0.1"  # Proxies trusted for X-Forwarded-For ("*" = any)
+    client_ip_header: str = ""  # Header set by the edge proxy with the client address, e.g. CF-Connecting-IP
     cors_origins: List[str] = ["http://localhost:19006", "exp://192.168.1.100:19000"]
     
     # Security
     secret_key: str = "your-super-secret-key-change-this-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    auth_rate_limit: str = "5/minute"  # Per client IP on unauthenticated auth endpoints
     
     # Environment
     environment: str = "development"
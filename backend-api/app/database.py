@@ -13,6 +13,7 @@ engine = create_async_engine(
     pool_pre_ping=True,
     pool_size=10,
     max_overflow=20,
+    query_cache_size=1200,
 )
 
 # Create async session factory
@@ -0,0 +1,39 @@
+"""
+Shared settings for outbound HTTP clients (GoTrue and Proxmox)
+"""
+from typing import Dict, Optional
+import httpx
+
+from app.config import settings
+
+
+def create_http_client(
+    base_url: str,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs
+) -> httpx.AsyncClient:
+    """
+    Create a pooled async HTTP client
+    
+    Requests multiplex over HTTP/2 when the server negotiates it (falling
+    back to keep-alive HTTP/1.1 otherwise) and ask for gzip-compressed bodies.
+    
+    Args:
+        base_url: Base URL for relative request paths
+        headers: Extra default headers
+        **kwargs: Passed through to httpx.AsyncClient
+        
+    Returns:
+        Configured httpx.AsyncClient
+    """
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers={"Accept-Encoding": "gzip", **(headers or {})},
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+        ),
+        timeout=settings.http_timeout,
+        http2=True,
+        **kwargs
+    )
@@ -0,0 +1,34 @@
+"""
+Rate limiting for unauthenticated endpoints
+"""
+from typing import Optional
+from fastapi import Request
+from slowapi import Limiter
+
+from app.config import settings
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    Address of the client that sent a request
+    
+    With CLIENT_IP_HEADER set (e.g. CF-Connecting-IP behind Cloudflare), the
+    address is taken from that header, which the edge proxy overwrites on
+    every request. Only set it when the API can't be reached around that
+    proxy. Otherwise the connection's peer address is used.
+    """
+    if settings.client_ip_header:
+        address = request.headers.get(settings.client_ip_header)
+        if address:
+            return address.strip()
+    return request.client.host if request.client else None
+
+
+# Counters live in Redis so limits hold across workers and replicas. If
+# Redis is down, limits are enforced per process instead of failing requests.
+limiter = Limiter(
+    key_func=client_ip,
+    storage_uri=settings.redis_url,
+    in_memory_fallback_enabled=True,
+    swallow_errors=True,
+)
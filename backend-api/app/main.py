@@ -1,26 +1,68 @@
 """
 Main FastAPI application
 """
-from fastapi import FastAPI, status
+from fastapi import FastAPI, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import SlowAPIMiddleware
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from contextlib import asynccontextmanager
+import asyncio
 import logging
-from datetime import datetime
+import orjson
+import time
+from datetime import datetime, timezone
 
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, get_db
 from app.routers import auth, vms, admin
 from app.schemas import HealthResponse
 from app.proxmox import proxmox_client
 from app.auth import gotrue_client
+from app.limiter import limiter
+from app.cache import redis
+from app.audit import audit_writer, stop_audit_writer
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record for log aggregators
+    
+    No timestamp is included; the aggregator stamps records on ingest.
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode()
+
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+if settings.environment == "production":
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
+else:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
 logger = logging.getLogger(__name__)
 
+# Health results are reused for a few seconds so frequent probes
+# don't fan out to Proxmox, GoTrue and the database every time.
+# The cached value is the already-serialized response body.
+HEALTH_CACHE_TTL = 5.0
+_health_cache = {"at": 0.0, "value": None}
+_health_lock = asyncio.Lock()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -29,16 +71,25 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     logger.info("Starting Proxmox Controller API...")
+    await gotrue_client.open()
+    await proxmox_client.open()
+    refresh_task = asyncio.create_task(proxmox_client.refresh_loop())
+    audit_task = asyncio.create_task(audit_writer())
     try:
         await init_db()
         logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Failed to initialize database: {e}")
+        logger.error("Failed to initialize database: %s", e)
     
     yield
     
     # Shutdown
     logger.info("Shutting down Proxmox Controller API...")
+    refresh_task.cancel()
+    await stop_audit_writer(audit_task)
+    await gotrue_client.close()
+    await proxmox_client.close()
+    await redis.aclose()
 
 
 # Create FastAPI app
@@ -47,8 +98,14 @@ app = FastAPI(
     description="API for managing Proxmox VMs with user authentication",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Configure rate limiting
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_middleware(SlowAPIMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -77,7 +134,7 @@ async def root():
 
 
 @app.get("/health", response_model=HealthResponse, status_code=status.HTTP_200_OK)
-async def health_check():
+async def health_check(db: AsyncSession = Depends(get_db)):
     """
     Health check endpoint
     
@@ -85,39 +142,76 @@ async def health_check():
     - Database
     - Proxmox API
     - GoTrue service
-    """
-    # Check Proxmox
-    proxmox_status = "healthy" if await proxmox_client.health_check() else "unhealthy"
-    
-    # Check GoTrue
-    gotrue_status = "healthy" if await gotrue_client.health_check() else "unhealthy"
     
-    # Database is assumed healthy if this endpoint responds
-    # (could add explicit check if needed)
-    database_status = "healthy"
+    Results are cached for HEALTH_CACHE_TTL seconds.
+    """
+    if time.monotonic() - _health_cache["at"] < HEALTH_CACHE_TTL:
+        return Response(content=_health_cache["value"], media_type="application/json")
     
-    overall_status = "healthy" if all([
-        proxmox_status == "healthy",
-        gotrue_status == "healthy",
-        database_status == "healthy"
-    ]) else "degraded"
+    # Concurrent probes wait for a single upstream check
+    async with _health_lock:
+        if time.monotonic() - _health_cache["at"] < HEALTH_CACHE_TTL:
+            return Response(content=_health_cache["value"], media_type="application/json")
+        
+        # Check Proxmox and GoTrue
+        proxmox_ok, gotrue_ok = await asyncio.gather(
+            proxmox_client.health_check(),
+            gotrue_client.health_check()
+        )
+        proxmox_status = "healthy" if proxmox_ok else "unhealthy"
+        gotrue_status = "healthy" if gotrue_ok else "unhealthy"
+        
+        # Check database
+        try:
+            await db.execute(text("SELECT 1"))
+            database_status = "healthy"
+        except Exception as e:
+            logger.error("Database health check failed: %s", e)
+            database_status = "unhealthy"
+        
+        overall_status = "healthy" if all([
+            proxmox_status == "healthy",
+            gotrue_status == "healthy",
+            database_status == "healthy"
+        ]) else "degraded"
+        
+        health = HealthResponse(
+            status=overall_status,
+            database=database_status,
+            proxmox=proxmox_status,
+            gotrue=gotrue_status,
+            timestamp=datetime.now(timezone.utc)
+        )
+        _health_cache["value"] = orjson.dumps(health.model_dump())
+        _health_cache["at"] = time.monotonic()
     
-    return HealthResponse(
-        status=overall_status,
-        database=database_status,
-        proxmox=proxmox_status,
-        gotrue=gotrue_status,
-        timestamp=datetime.utcnow()
-    )
+    return Response(content=_health_cache["value"], media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
     
-    uvicorn.run(
-        "app.main:app",
-        host=settings.api_host,
-        port=settings.api_port,
-        reload=settings.api_reload,
-        log_level="info"
-    )
+    if settings.environment == "production":
+        # uvloop/httptools come with uvicorn[standard]. Each worker has its
+        # own DB pool and runs its own VM snapshot refresh loop, so keep
+        # API_WORKERS in line with the CPUs actually available
+        uvicorn.run(
+            "app.main:app",
+            host=settings.api_host,
+            port=settings.api_port,
+            loop="uvloop",
+            http="httptools",
+            workers=settings.api_workers,
+            forwarded_allow_ips=settings.forwarded_allow_ips,
+            reload=False,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.api_host,
+            port=settings.api_port,
+            reload=settings.api_reload,
+            forwarded_allow_ips=settings.forwarded_allow_ips,
+            log_level="info"
+        )
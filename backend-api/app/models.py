@@ -1,7 +1,8 @@
 """
 SQLAlchemy database models
 """
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, BigInteger, Integer, String, Boolean, ForeignKey, DateTime, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -14,12 +15,18 @@ class User(Base):
     id = Column(String, primary_key=True)  # GoTrue user ID
     email = Column(String, unique=True, nullable=False, index=True)
     is_admin = Column(Boolean, default=False, nullable=False)
+    # Epoch second of the last revoke; tokens whose session signed in at or
+    # before it are rejected (see auth.session_auth_time)
+    sso_jwt_version = Column(BigInteger, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     vm_assignments = relationship("VMAssignment", back_populates="user", cascade="all, delete-orphan")
     
+    # Fetch server defaults (created_at) via RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<User {self.email}>"
 
@@ -38,9 +45,13 @@ class VMAssignment(Base):
     # Relationships
     user = relationship("User", back_populates="vm_assignments")
     
+    __mapper_args__ = {"eager_defaults": True}
+    
     # Constraints - one user can only be assigned to one VM
+    # The (user_id, vm_id) index answers access checks from the index alone
     __table_args__ = (
         UniqueConstraint('user_id', name='unique_user_vm_assignment'),
+        Index("ix_vmassign_user_vm", "user_id", "vm_id", unique=True),
     )
     
     def __repr__(self):
@@ -56,11 +67,20 @@ class AuditLog(Base):
     user_email = Column(String, nullable=False)
     action = Column(String, nullable=False)  # start, stop, status_check
     vm_id = Column(Integer, nullable=False)
-    vm_name = Column(String, nullable=True)
     success = Column(Boolean, nullable=False)
-    error_message = Column(String, nullable=True)
-    ip_address = Column(String, nullable=True)
+    details = Column(JSONB, nullable=False, server_default="{}")  # vm_name, error_message, ip_address
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Indexes for per-user/per-VM history and time-based retention sweeps;
+    # one GIN index covers lookups on any key in details
+    __table_args__ = (
+        Index("ix_audit_user_ts", "user_id", "timestamp"),
+        Index("ix_audit_vm_ts", "vm_id", "timestamp"),
+        Index("ix_audit_ts", "timestamp"),
+        Index("ix_audit_details", "details", postgresql_using="gin"),
+    )
+    
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<AuditLog {self.user_email} {self.action} VM:{self.vm_id}>"
@@ -1,60 +1,199 @@
 """
 Proxmox API client for VM management
 """
-from proxmoxer import ProxmoxAPI
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
+import asyncio
+import httpx
 import logging
+import time
 from app.config import settings
+from app.http_client import create_http_client
 
 logger = logging.getLogger(__name__)
 
 
+class ProxmoxAPIError(Exception):
+    """Error response from the Proxmox API"""
+    
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+@dataclass
+class VMSnapshot:
+    """Most recent VM list fetched from the node"""
+    data: Dict[int, Dict] = field(default_factory=dict)
+    updated_at: float = 0.0  # Unix time of the fetch, 0 if never fetched
+    
+    def age(self) -> float:
+        """Seconds since the snapshot was taken"""
+        return time.time() - self.updated_at
+
+
 class ProxmoxClient:
-    """Proxmox API client wrapper"""
+    """Async client for the Proxmox VE HTTPS API"""
     
     def __init__(self):
         """Initialize Proxmox client"""
-        try:
-            self.client = ProxmoxAPI(
-                settings.proxmox_host,
-                port=settings.proxmox_port,
-                user=settings.proxmox_user,
-                token_name=settings.proxmox_token_name,
-                token_value=settings.proxmox_token_value,
-                verify_ssl=settings.proxmox_verify_ssl,
+        self.base_url = f"https://{settings.proxmox_host}:{settings.proxmox_port}"
+        self.node = settings.proxmox_node
+        self._headers = {
+            "Authorization": (
+                f"PVEAPIToken={settings.proxmox_user}!"
+                f"{settings.proxmox_token_name}={settings.proxmox_token_value}"
             )
-            self.node = settings.proxmox_node
-            logger.info(f"Proxmox client initialized for node: {self.node}")
-        except Exception as e:
-            logger.error(f"Failed to initialize Proxmox client: {e}")
-            raise
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # VM list kept current by refresh_loop(); handlers read from it
+        self.snapshot = VMSnapshot()
+        self.refresh_interval = settings.proxmox_refresh_interval
+        self._refresh_lock = asyncio.Lock()
+        logger.info("Proxmox client initialized for node: %s", self.node)
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, creating it on first use"""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = create_http_client(
+                        self.base_url,
+                        headers=self._headers,
+                        verify=settings.proxmox_verify_ssl,
+                    )
+        return self._client
     
-    async def get_vm_status(self, vm_id: int) -> Dict:
+    async def open(self):
+        """Create the shared HTTP client up front (called at app startup)"""
+        await self._get_client()
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _vm_path(self, vm_id: int, *parts: str) -> str:
+        """Build an API path below a VM on the configured node"""
+        return "/".join((f"/api2/json/nodes/{self.node}/qemu/{vm_id}",) + parts)
+    
+    async def _request(self, method: str, path: str) -> Any:
+        """
+        Send a request to the Proxmox API
+        
+        Args:
+            method: HTTP method
+            path: API path, e.g. /api2/json/version
+            
+        Returns:
+            The "data" member of the response body
+        """
+        client = await self._get_client()
+        response = await client.request(method, path)
+        
+        if response.status_code >= 400:
+            # The reason phrase is empty over HTTP/2; use the body's error text
+            try:
+                body = response.json() or {}
+            except ValueError:
+                body = {}
+            message = body.get("message") or body.get("errors") or response.reason_phrase
+            raise ProxmoxAPIError(response.status_code, str(message).strip())
+        
+        return response.json().get("data")
+    
+    def _shape_vm(self, vm_id: int, data: Dict) -> Dict:
+        """Convert a Proxmox VM record into the status dict used by the API"""
+        return {
+            "vm_id": vm_id,
+            "vm_name": data.get("name", f"VM-{vm_id}"),
+            "status": data.get("status", "unknown"),
+            "uptime": data.get("uptime", 0),
+            "cpu": data.get("cpu", 0),
+            "memory": data.get("mem", 0),
+            "maxmem": data.get("maxmem", 0),
+        }
+    
+    async def get_vm_status(self, vm_id: int, fresh: bool = False) -> Dict:
         """
         Get VM status and information
         
         Args:
             vm_id: Proxmox VM ID
+            fresh: Query Proxmox directly instead of using the snapshot
             
         Returns:
             Dict with VM status information
         """
+        if not fresh:
+            vm = self.snapshot.data.get(vm_id)
+            if vm is not None and self.snapshot.age() < self.refresh_interval * 2:
+                return vm
+        
         try:
             # Get VM configuration
-            vm_config = self.client.nodes(self.node).qemu(vm_id).status.current.get()
-            
-            return {
-                "vm_id": vm_id,
-                "vm_name": vm_config.get("name", f"VM-{vm_id}"),
-                "status": vm_config.get("status", "unknown"),
-                "uptime": vm_config.get("uptime", 0),
-                "cpu": vm_config.get("cpu", 0),
-                "memory": vm_config.get("mem", 0),
-                "maxmem": vm_config.get("maxmem", 0),
-            }
+            vm_config = await self._request("GET", self._vm_path(vm_id, "status", "current"))
+            vm = self._shape_vm(vm_id, vm_config)
         except Exception as e:
-            logger.error(f"Error getting VM {vm_id} status: {e}")
+            logger.error("Error getting VM %s status: %s", vm_id, e)
             raise Exception(f"Failed to get VM status: {str(e)}")
+        
+        # Keep the snapshot in step so list views see the newer state too
+        if self.snapshot.updated_at:
+            self.snapshot.data[vm_id] = vm
+        return vm
+    
+    async def refresh_snapshot(self) -> VMSnapshot:
+        """
+        Fetch every VM on the node with a single API call into the snapshot
+        
+        Returns:
+            The updated snapshot
+        """
+        data = await self._request("GET", f"/api2/json/nodes/{self.node}/qemu")
+        vms = {int(vm["vmid"]): self._shape_vm(int(vm["vmid"]), vm) for vm in data}
+        self.snapshot = VMSnapshot(data=vms, updated_at=time.time())
+        return self.snapshot
+    
+    async def refresh_loop(self):
+        """Keep the snapshot current; runs for the lifetime of the app"""
+        while True:
+            try:
+                async with self._refresh_lock:
+                    await self.refresh_snapshot()
+            except Exception as e:
+                logger.warning("VM snapshot refresh failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+    
+    async def list_node_vms(self) -> Dict[int, Dict]:
+        """
+        Get status for every VM on the node
+        
+        Served from the snapshot kept by refresh_loop(). If the snapshot is
+        older than two refresh intervals it is refreshed inline; if Proxmox
+        can't be reached then, the stale snapshot is returned instead.
+        
+        Returns:
+            Dict mapping VM ID to VM status information
+        """
+        max_age = self.refresh_interval * 2
+        if self.snapshot.age() < max_age:
+            return self.snapshot.data
+        
+        async with self._refresh_lock:
+            if self.snapshot.age() < max_age:
+                return self.snapshot.data
+            try:
+                await self.refresh_snapshot()
+            except Exception as e:
+                if not self.snapshot.updated_at:
+                    raise
+                logger.warning("Serving last known VM list, Proxmox unavailable: %s", e)
+        
+        return self.snapshot.data
     
     async def get_all_vms(self, vm_ids: Optional[List[int]] = None) -> List[Dict]:
         """
@@ -69,23 +208,75 @@ class ProxmoxClient:
         if vm_ids is None:
             vm_ids = [106, 103, 101, 102]
         
+        try:
+            node_vms = await self.list_node_vms()
+            error = "VM not found on node"
+        except Exception as e:
+            logger.warning("Could not list VMs on node %s: %s", self.node, e)
+            node_vms = {}
+            error = str(e)
+        
         vms = []
         for vm_id in vm_ids:
-            try:
-                vm_status = await self.get_vm_status(vm_id)
-                vms.append(vm_status)
-            except Exception as e:
-                logger.warning(f"Could not get status for VM {vm_id}: {e}")
+            vm = node_vms.get(vm_id)
+            if vm is None:
                 # Add VM with unknown status
-                vms.append({
+                vm = {
                     "vm_id": vm_id,
                     "vm_name": f"VM-{vm_id}",
                     "status": "unknown",
-                    "error": str(e)
-                })
+                    "error": error
+                }
+            vms.append(vm)
         
         return vms
     
+    async def _post_action(
+        self, vm_id: int, action: str, conflict: str, target: str
+    ) -> Tuple[bool, str]:
+        """
+        Send a power action unless the VM is already in the target state
+        
+        The current state comes from the snapshot, so with a fresh snapshot
+        the action costs a single Proxmox round trip; a stale snapshot adds a
+        status read first. Proxmox accepts start/stop/shutdown as background
+        tasks and reports "already running" only in the task, not in the
+        response, so the state has to be known before the POST. A synchronous
+        rejection (the state changed since the snapshot) is still recognized.
+        
+        Once the action is accepted, the VM's snapshot entry is set to the
+        target status. Re-reading the status at this point would usually still
+        return the old state; the refresh loop corrects the entry within one
+        interval.
+        
+        Args:
+            vm_id: Proxmox VM ID
+            action: Status action (start, stop, shutdown)
+            conflict: Error text Proxmox returns if the VM is already in the target state
+            target: Status the VM ends up in once the action completes
+            
+        Returns:
+            Tuple of (sent, vm_name); sent is False if the VM was already in the target state
+        """
+        vm = await self.get_vm_status(vm_id)
+        vm_name = vm["vm_name"]
+        if vm["status"] == target:
+            return False, vm_name
+        
+        try:
+            await self._request("POST", self._vm_path(vm_id, "status", action))
+        except ProxmoxAPIError as e:
+            if conflict in e.message.lower():
+                return False, vm_name
+            raise
+        
+        # Views recomputed right after the action shouldn't show the old state
+        vm = self.snapshot.data.get(vm_id)
+        if vm is not None:
+            self.snapshot.data[vm_id] = {**vm, "status": target}
+        
+        return True, vm_name
+    
     async def start_vm(self, vm_id: int) -> Dict:
         """
         Start a VM
@@ -97,33 +288,30 @@ class ProxmoxClient:
             Dict with operation result
         """
         try:
-            # Check current status first
-            current_status = await self.get_vm_status(vm_id)
+            # Start the VM
+            sent, vm_name = await self._post_action(vm_id, "start", "already running", "running")
             
-            if current_status["status"] == "running":
+            if not sent:
                 return {
                     "success": False,
                     "message": "VM is already running",
                     "vm_id": vm_id,
-                    "vm_name": current_status["vm_name"],
+                    "vm_name": vm_name,
                     "status": "running",
                 }
             
-            # Start the VM
-            self.client.nodes(self.node).qemu(vm_id).status.start.post()
-            
-            logger.info(f"Successfully started VM {vm_id}")
+            logger.info("Successfully started VM %s", vm_id)
             
             return {
                 "success": True,
                 "message": "VM start command sent successfully",
                 "vm_id": vm_id,
-                "vm_name": current_status["vm_name"],
+                "vm_name": vm_name,
                 "status": "starting",
             }
             
         except Exception as e:
-            logger.error(f"Error starting VM {vm_id}: {e}")
+            logger.error("Error starting VM %s: %s", vm_id, e)
             raise Exception(f"Failed to start VM: {str(e)}")
     
     async def stop_vm(self, vm_id: int) -> Dict:
@@ -137,32 +325,30 @@ class ProxmoxClient:
             Dict with operation result
         """
         try:
-            current_status = await self.get_vm_status(vm_id)
+            # Stop the VM
+            sent, vm_name = await self._post_action(vm_id, "stop", "not running", "stopped")
             
-            if current_status["status"] == "stopped":
+            if not sent:
                 return {
                     "success": False,
                     "message": "VM is already stopped",
                     "vm_id": vm_id,
-                    "vm_name": current_status["vm_name"],
+                    "vm_name": vm_name,
                     "status": "stopped",
                 }
             
-            # Stop the VM
-            self.client.nodes(self.node).qemu(vm_id).status.stop.post()
-            
-            logger.info(f"Successfully stopped VM {vm_id}")
+            logger.info("Successfully stopped VM %s", vm_id)
             
             return {
                 "success": True,
                 "message": "VM stop command sent successfully",
                 "vm_id": vm_id,
-                "vm_name": current_status["vm_name"],
+                "vm_name": vm_name,
                 "status": "stopping",
             }
             
         except Exception as e:
-            logger.error(f"Error stopping VM {vm_id}: {e}")
+            logger.error("Error stopping VM %s: %s", vm_id, e)
             raise Exception(f"Failed to stop VM: {str(e)}")
     
     async def shutdown_vm(self, vm_id: int) -> Dict:
@@ -176,32 +362,30 @@ class ProxmoxClient:
             Dict with operation result
         """
         try:
-            current_status = await self.get_vm_status(vm_id)
+            # Shutdown the VM
+            sent, vm_name = await self._post_action(vm_id, "shutdown", "not running", "stopped")
             
-            if current_status["status"] == "stopped":
+            if not sent:
                 return {
                     "success": False,
                     "message": "VM is already stopped",
                     "vm_id": vm_id,
-                    "vm_name": current_status["vm_name"],
+                    "vm_name": vm_name,
                     "status": "stopped",
                 }
             
-            # Shutdown the VM
-            self.client.nodes(self.node).qemu(vm_id).status.shutdown.post()
-            
-            logger.info(f"Successfully sent shutdown command to VM {vm_id}")
+            logger.info("Successfully sent shutdown command to VM %s", vm_id)
             
             return {
                 "success": True,
                 "message": "VM shutdown command sent successfully",
                 "vm_id": vm_id,
-                "vm_name": current_status["vm_name"],
+                "vm_name": vm_name,
                 "status": "shutting_down",
             }
             
         except Exception as e:
-            logger.error(f"Error shutting down VM {vm_id}: {e}")
+            logger.error("Error shutting down VM %s: %s", vm_id, e)
             raise Exception(f"Failed to shutdown VM: {str(e)}")
     
     async def health_check(self) -> bool:
@@ -212,10 +396,10 @@ class ProxmoxClient:
             True if accessible, False otherwise
         """
         try:
-            self.client.version.get()
+            await self._request("GET", "/api2/json/version")
             return True
         except Exception as e:
-            logger.error(f"Proxmox health check failed: {e}")
+            logger.error("Proxmox health check failed: %s", e)
             return False
 
 
@@ -1,27 +1,79 @@
 """
 Admin-only routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List
+from sqlalchemy import select, func, update, delete
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.orm import selectinload
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+import asyncio
+import time
 
 from app.database import get_db
 from app.schemas import (
-    UserCreate, UserResponse, VMAssignmentCreate, 
-    VMAssignmentResponse, AdminStatsResponse
+    UserCreate, UserResponse, VMAssignmentCreate, VMAssignmentResponse,
+    PaginatedUsersResponse, PaginatedAssignmentsResponse,
+    AuditLogResponse, AuditLogPageResponse, AdminStatsResponse, VMStatus
+)
+from app.auth import (
+    CurrentUser, get_current_admin_user, gotrue_client,
+    invalidate_user_cache, invalidate_vm_access
+)
+from app.cache import (
+    ADMIN_NAMESPACE, adjust_user_count, cache_response, get_user_count,
+    invalidate_vm_views, set_user_count
 )
-from app.auth import get_current_admin_user, gotrue_client
 from app.models import User, VMAssignment, AuditLog
 from app.proxmox import proxmox_client
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Ten most recent audit entries, only the columns shown on the dashboard
+_RECENT_LOGS = (
+    select(
+        AuditLog.user_email, AuditLog.action, AuditLog.vm_id,
+        AuditLog.details["vm_name"].astext.label("vm_name"),
+        AuditLog.success, AuditLog.timestamp
+    )
+    .order_by(AuditLog.timestamp.desc())
+    .limit(10)
+    .subquery("recent")
+)
+
+# The entries aggregated into one JSON array in the database, newest first
+_RECENT_ACTIONS = func.json_agg(
+    aggregate_order_by(_RECENT_LOGS.table_valued(), _RECENT_LOGS.c.timestamp.desc()),
+    type_=JSON
+).label("recent_actions")
+
+# Dashboard rows: recent actions alone, or together with the user count
+# when the Redis counter needs reseeding (one round trip either way)
+_STATS_RECENT = select(_RECENT_ACTIONS).select_from(_RECENT_LOGS)
+_STATS_RECENT_WITH_COUNT = select(
+    select(func.count(User.id)).scalar_subquery().label("total_users"),
+    _RECENT_ACTIONS
+).select_from(_RECENT_LOGS)
+
+
+async def _total_users(db: AsyncSession) -> int:
+    """Number of users, from the Redis counter or an exact count on a miss"""
+    total = await get_user_count()
+    if total is None:
+        total = await db.scalar(select(func.count(User.id)))
+        await set_user_count(total)
+    return total
+
 
 @router.post("/users", response_model=UserResponse)
 async def create_user(
     user_data: UserCreate,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -52,14 +104,6 @@ async def create_user(
         )
         db.add(new_user)
         await db.commit()
-        await db.refresh(new_user)
-        
-        return UserResponse(
-            id=new_user.id,
-            email=new_user.email,
-            is_admin=new_user.is_admin,
-            created_at=new_user.created_at
-        )
     
     except HTTPException:
         raise
@@ -68,34 +112,42 @@ async def create_user(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create user: {str(e)}"
         )
+    
+    # The user exists from here on; cache upkeep must not fail the request
+    await adjust_user_count(1)
+    await invalidate_vm_views()
+    
+    return new_user
 
 
-@router.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=PaginatedUsersResponse)
 async def list_users(
-    current_admin: User = Depends(get_current_admin_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List all users (Admin only)
+    List users, newest first (Admin only)
     """
-    result = await db.execute(select(User))
-    users = result.scalars().all()
+    result = await db.execute(
+        select(User)
+        .order_by(User.created_at.desc(), User.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    items = result.scalars().all()
     
-    return [
-        UserResponse(
-            id=user.id,
-            email=user.email,
-            is_admin=user.is_admin,
-            created_at=user.created_at
-        )
-        for user in users
-    ]
+    return PaginatedUsersResponse(
+        items=[UserResponse.model_validate(user) for user in items],
+        total=await _total_users(db)
+    )
 
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -103,8 +155,7 @@ async def delete_user(
     
     Note: This only deletes from local DB. GoTrue user should be deleted separately.
     """
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    user = await db.get(User, user_id)
     
     if not user:
         raise HTTPException(
@@ -112,26 +163,66 @@ async def delete_user(
             detail="User not found"
         )
     
+    # Assignments go with the user (cascade); remember them to drop cached access
+    vm_ids_result = await db.execute(
+        select(VMAssignment.vm_id).where(VMAssignment.user_id == user_id)
+    )
+    vm_ids = vm_ids_result.scalars().all()
+    
     await db.delete(user)
     await db.commit()
+    await adjust_user_count(-1)
+    invalidate_user_cache(user_id)
+    for vm_id in vm_ids:
+        await invalidate_vm_access(user_id, vm_id)
+    await invalidate_vm_views()
     
     return {"message": f"User {user.email} deleted successfully"}
 
 
+@router.post("/users/{user_id}/revoke-tokens")
+async def revoke_user_tokens(
+    user_id: str,
+    current_admin: CurrentUser = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Revoke all tokens issued to a user so far (Admin only)
+    
+    Bumps the user's sso_jwt_version to the current time; tokens from
+    sessions signed in up to then are rejected, and so are tokens later
+    refreshed from those sessions. The user has to sign in again. Other
+    workers notice within the auth cache TTL.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(sso_jwt_version=int(time.time()))
+    )
+    
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    await db.commit()
+    invalidate_user_cache(user_id)
+    
+    return {"message": f"Tokens for user {user_id} revoked"}
+
+
 @router.post("/vm-assignments", response_model=VMAssignmentResponse)
 async def assign_vm_to_user(
     assignment_data: VMAssignmentCreate,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Assign a VM to a user (Admin only)
     """
     # Check if user exists
-    user_result = await db.execute(
-        select(User).where(User.id == assignment_data.user_id)
-    )
-    user = user_result.scalar_one_or_none()
+    user = await db.get(User, assignment_data.user_id)
     
     if not user:
         raise HTTPException(
@@ -169,7 +260,8 @@ async def assign_vm_to_user(
     )
     db.add(assignment)
     await db.commit()
-    await db.refresh(assignment)
+    await invalidate_vm_access(assignment.user_id, assignment.vm_id)
+    await invalidate_vm_views()
     
     return VMAssignmentResponse(
         id=assignment.id,
@@ -177,65 +269,54 @@ async def assign_vm_to_user(
         vm_id=assignment.vm_id,
         vm_name=assignment.vm_name,
         created_at=assignment.created_at,
-        user=UserResponse(
-            id=user.id,
-            email=user.email,
-            is_admin=user.is_admin,
-            created_at=user.created_at
-        )
+        user=UserResponse.model_validate(user)
     )
 
 
-@router.get("/vm-assignments", response_model=List[VMAssignmentResponse])
+@router.get("/vm-assignments", response_model=PaginatedAssignmentsResponse)
 async def list_vm_assignments(
-    current_admin: User = Depends(get_current_admin_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List all VM assignments (Admin only)
+    List VM assignments (Admin only)
     """
+    # Load the assigned users in one extra query instead of one per row
     result = await db.execute(
-        select(VMAssignment).join(User)
+        select(VMAssignment)
+        .options(selectinload(VMAssignment.user))
+        .order_by(VMAssignment.id)
+        .limit(limit)
+        .offset(offset)
     )
-    assignments = result.scalars().all()
-    
-    response = []
-    for assignment in assignments:
-        user_result = await db.execute(
-            select(User).where(User.id == assignment.user_id)
-        )
-        user = user_result.scalar_one()
-        
-        response.append(VMAssignmentResponse(
-            id=assignment.id,
-            user_id=assignment.user_id,
-            vm_id=assignment.vm_id,
-            vm_name=assignment.vm_name,
-            created_at=assignment.created_at,
-            user=UserResponse(
-                id=user.id,
-                email=user.email,
-                is_admin=user.is_admin,
-                created_at=user.created_at
-            )
-        ))
+    items = result.scalars().all()
+    total = await db.scalar(select(func.count(VMAssignment.id)))
     
-    return response
+    # Serialized via from_attributes, including the preloaded user
+    return PaginatedAssignmentsResponse(
+        items=[VMAssignmentResponse.model_validate(a) for a in items],
+        total=total
+    )
 
 
 @router.delete("/vm-assignments/{assignment_id}")
 async def delete_vm_assignment(
     assignment_id: int,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a VM assignment (Admin only)
     """
+    # Delete in one statement; RETURNING tells us whether it existed
     result = await db.execute(
-        select(VMAssignment).where(VMAssignment.id == assignment_id)
+        delete(VMAssignment)
+        .where(VMAssignment.id == assignment_id)
+        .returning(VMAssignment.user_id, VMAssignment.vm_id)
     )
-    assignment = result.scalar_one_or_none()
+    assignment = result.one_or_none()
     
     if not assignment:
         raise HTTPException(
@@ -243,53 +324,74 @@ async def delete_vm_assignment(
             detail="Assignment not found"
         )
     
-    await db.delete(assignment)
     await db.commit()
+    await invalidate_vm_access(assignment.user_id, assignment.vm_id)
+    await invalidate_vm_views()
     
     return {"message": "VM assignment deleted successfully"}
 
 
+@router.get("/audit-logs", response_model=AuditLogPageResponse)
+async def list_audit_logs(
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_admin: CurrentUser = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List audit log entries, newest first (Admin only)
+    
+    Paginated by id rather than offset: pass next_before from the previous
+    page as ?before= to continue. Each page is a primary key range scan, so
+    deep pages cost the same as the first one.
+    """
+    query = select(AuditLog).order_by(AuditLog.id.desc()).limit(limit)
+    if before is not None:
+        query = query.where(AuditLog.id < before)
+    
+    result = await db.execute(query)
+    items = result.scalars().all()
+    
+    return AuditLogPageResponse(
+        items=[AuditLogResponse.model_validate(log) for log in items],
+        next_before=items[-1].id if len(items) == limit else None
+    )
+
+
 @router.get("/stats", response_model=AdminStatsResponse)
+@cache_response(expire=10, namespace=ADMIN_NAMESPACE)
 async def get_admin_stats(
-    current_admin: User = Depends(get_current_admin_user),
+    request: Request,
+    current_admin: CurrentUser = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Get admin statistics dashboard (Admin only)
     """
-    # Count users
-    user_count_result = await db.execute(select(func.count(User.id)))
-    total_users = user_count_result.scalar()
-    
-    # Get VM statuses
-    all_vms = await proxmox_client.get_all_vms()
-    vms_running = sum(1 for vm in all_vms if vm["status"] == "running")
-    vms_stopped = sum(1 for vm in all_vms if vm["status"] == "stopped")
+    async def load_db_stats() -> Tuple[int, List[Dict]]:
+        # User count from Redis; on a miss it is counted in the same statement
+        total = await get_user_count()
+        if total is None:
+            row = (await db.execute(_STATS_RECENT_WITH_COUNT)).one()
+            total = row.total_users
+            await set_user_count(total)
+        else:
+            row = (await db.execute(_STATS_RECENT)).one()
+        # json_agg yields NULL when there are no entries
+        return total, row.recent_actions or []
     
-    # Get recent audit logs
-    recent_logs_result = await db.execute(
-        select(AuditLog)
-        .order_by(AuditLog.timestamp.desc())
-        .limit(10)
+    # Query the database and get VM statuses concurrently
+    (total_users, recent_actions), all_vms = await asyncio.gather(
+        load_db_stats(),
+        proxmox_client.get_all_vms()
     )
-    recent_logs = recent_logs_result.scalars().all()
     
-    recent_actions = [
-        {
-            "user_email": log.user_email,
-            "action": log.action,
-            "vm_id": log.vm_id,
-            "vm_name": log.vm_name,
-            "success": log.success,
-            "timestamp": log.timestamp.isoformat()
-        }
-        for log in recent_logs
-    ]
+    status_counts = Counter(vm["status"] for vm in all_vms)
     
     return AdminStatsResponse(
         total_users=total_users,
         total_vms=len(all_vms),
-        vms_running=vms_running,
-        vms_stopped=vms_stopped,
+        vms_running=status_counts[VMStatus.running],
+        vms_stopped=status_counts[VMStatus.stopped],
         recent_actions=recent_actions
     )
@@ -1,20 +1,24 @@
 """
 Authentication routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.database import get_db
 from app.schemas import UserLogin, UserResponse, TokenResponse
 from app.auth import gotrue_client
+from app.cache import adjust_user_count
+from app.config import settings
+from app.limiter import limiter
 from app.models import User
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/login", response_model=TokenResponse)
+@limiter.limit(settings.auth_rate_limit)
 async def login(
+    request: Request,
     credentials: UserLogin,
     db: AsyncSession = Depends(get_db)
 ):
@@ -40,10 +44,7 @@ async def login(
         )
     
     # Check if user exists in database
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
-    user = result.scalar_one_or_none()
+    user = await db.get(User, user_id)
     
     if not user:
         # Create user in local database
@@ -54,40 +55,56 @@ async def login(
         )
         db.add(user)
         await db.commit()
-        await db.refresh(user)
+        await adjust_user_count(1)
     
     # Return token response
     return TokenResponse(
         access_token=auth_response["access_token"],
         token_type="bearer",
         expires_in=auth_response.get("expires_in", 3600),
-        user=UserResponse(
-            id=user.id,
-            email=user.email,
-            is_admin=user.is_admin,
-            created_at=user.created_at
-        )
+        user=UserResponse.model_validate(user)
     )
 
 
 @router.post("/refresh")
-async def refresh_token(refresh_token: str):
+@limiter.limit(settings.auth_rate_limit)
+async def refresh_token(request: Request, refresh_token: str):
     """
     Refresh access token
     """
     return await gotrue_client.refresh_token(refresh_token)
 
 
-@router.post("/request-password-reset")
-async def request_password_reset(email: str):
+async def _send_password_reset(email: str):
+    """Forward a password reset request to GoTrue (runs after the response)"""
+    try:
+        await gotrue_client.request_password_reset(email)
+    except HTTPException:
+        # Already logged by the GoTrue client; nothing to report to the caller
+        pass
+
+
+@router.post("/request-password-reset", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit(settings.auth_rate_limit)
+async def request_password_reset(
+    request: Request,
+    email: str,
+    background_tasks: BackgroundTasks
+):
     """
     Request password reset email
+    
+    The GoTrue call happens in the background; the response is the same
+    whether or not the account exists.
     """
-    return await gotrue_client.request_password_reset(email)
+    background_tasks.add_task(_send_password_reset, email)
+    return {"message": "Password reset email sent if account exists"}
 
 
 @router.post("/change-password")
+@limiter.limit(settings.auth_rate_limit)
 async def change_password(
+    request: Request,
     new_password: str,
     access_token: str
 ):
@@ -3,23 +3,32 @@ VM management routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 from typing import List
+import asyncio
 import logging
 
 from app.database import get_db
 from app.schemas import VMResponse, VMListResponse, VMActionResponse
-from app.auth import get_current_user
-from app.models import User, VMAssignment, AuditLog
+from app.audit import record_audit
+from app.auth import CurrentUser, get_current_user, require_vm_access
+from app.limiter import client_ip
+from app.cache import VMS_NAMESPACE, cache_response, invalidate_vm_views
+from app.models import User, VMAssignment
 from app.proxmox import proxmox_client
 
 router = APIRouter(prefix="/vms", tags=["Virtual Machines"])
 logger = logging.getLogger(__name__)
 
+# Built once at import, like the statements in app.auth (see _USER_LOOKUP)
+_ASSIGNMENT_BY_USER = select(VMAssignment).where(VMAssignment.user_id == bindparam("uid"))
+
 
 @router.get("/", response_model=VMListResponse)
+@cache_response(expire=10, namespace=VMS_NAMESPACE)
 async def list_vms(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -28,10 +37,10 @@ async def list_vms(
     - Regular users: Only their assigned VM
     - Admins: All VMs in the cluster
     """
+    # Get all VMs from Proxmox while the database queries below run; the
+    # session itself still runs one statement at a time
+    all_vms_task = asyncio.create_task(proxmox_client.get_all_vms())
     try:
-        # Get all VMs from Proxmox
-        all_vms = await proxmox_client.get_all_vms()
-        
         if current_user.is_admin:
             # Admin sees all VMs
             # Get assignments to show which user owns which VM
@@ -40,18 +49,21 @@ async def list_vms(
             
             assignment_map = {a.vm_id: a for a in assignments}
             
+            # Resolve all assigned users' emails with a single IN query
+            email_by_id = {}
+            if assignment_map:
+                user_ids = {a.user_id for a in assignment_map.values()}
+                user_result = await db.execute(
+                    select(User.id, User.email).where(User.id.in_(user_ids))
+                )
+                email_by_id = dict(user_result.tuples().all())
+            
+            all_vms = await all_vms_task
+            
             vm_responses = []
             for vm in all_vms:
                 assignment = assignment_map.get(vm["vm_id"])
-                assigned_user_email = None
-                
-                if assignment:
-                    user_result = await db.execute(
-                        select(User).where(User.id == assignment.user_id)
-                    )
-                    assigned_user = user_result.scalar_one_or_none()
-                    if assigned_user:
-                        assigned_user_email = assigned_user.email
+                assigned_user_email = email_by_id.get(assignment.user_id) if assignment else None
                 
                 vm_responses.append(VMResponse(
                     vm_id=vm["vm_id"],
@@ -66,15 +78,14 @@ async def list_vms(
         
         else:
             # Regular user sees only their assigned VM
-            result = await db.execute(
-                select(VMAssignment).where(VMAssignment.user_id == current_user.id)
-            )
+            result = await db.execute(_ASSIGNMENT_BY_USER, {"uid": current_user.id})
             assignment = result.scalar_one_or_none()
             
             if not assignment:
                 return VMListResponse(vms=[], total=0)
             
             # Find the user's VM in the list
+            all_vms = await all_vms_task
             user_vm = next((vm for vm in all_vms if vm["vm_id"] == assignment.vm_id), None)
             
             if not user_vm:
@@ -95,42 +106,32 @@ async def list_vms(
             return VMListResponse(vms=[vm_response], total=1)
     
     except Exception as e:
-        logger.error(f"Error listing VMs: {e}")
+        logger.error("Error listing VMs: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch VMs: {str(e)}"
         )
+    
+    finally:
+        all_vms_task.cancel()
 
 
 @router.get("/{vm_id}/status", response_model=VMResponse)
+@cache_response(expire=5, namespace=VMS_NAMESPACE, bypass=lambda kwargs: kwargs["fresh"])
 async def get_vm_status(
     vm_id: int,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    fresh: bool = False,
+    current_user: CurrentUser = Depends(require_vm_access)
 ):
     """
     Get status of a specific VM
     
-    Users can only query their assigned VM unless they are admin
+    Users can only query their assigned VM unless they are admin.
+    Pass ?fresh=true to bypass the cached response and VM snapshot.
     """
-    # Check permissions
-    if not current_user.is_admin:
-        result = await db.execute(
-            select(VMAssignment).where(
-                VMAssignment.user_id == current_user.id,
-                VMAssignment.vm_id == vm_id
-            )
-        )
-        assignment = result.scalar_one_or_none()
-        
-        if not assignment:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have access to this VM"
-            )
-    
     try:
-        vm_status = await proxmox_client.get_vm_status(vm_id)
+        vm_status = await proxmox_client.get_vm_status(vm_id, fresh=fresh)
         
         return VMResponse(
             vm_id=vm_status["vm_id"],
@@ -142,7 +143,7 @@ async def get_vm_status(
         )
     
     except Exception as e:
-        logger.error(f"Error getting VM {vm_id} status: {e}")
+        logger.error("Error getting VM %s status: %s", vm_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to get VM status: {str(e)}"
@@ -153,54 +154,27 @@ async def get_vm_status(
 async def start_vm(
     vm_id: int,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: CurrentUser = Depends(require_vm_access)
 ):
     """
     Start a VM
     
-    Users can only start their assigned VM unless they are admin
-    """
-    # Check permissions
-    if not current_user.is_admin:
-        result = await db.execute(
-            select(VMAssignment).where(
-                VMAssignment.user_id == current_user.id,
-                VMAssignment.vm_id == vm_id
-            )
-        )
-        assignment = result.scalar_one_or_none()
-        
-        if not assignment:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have access to this VM"
-            )
+    Users can only start their assigned VM unless they are admin.
     
+    The access check deliberately finishes before the start command is sent:
+    a started VM can't be taken back if the check then fails. With the access
+    decision cached in Redis, the VM's state taken from the snapshot and the
+    audit record queued, the request still waits on a single Proxmox round
+    trip.
+    """
     try:
         result = await proxmox_client.start_vm(vm_id)
-        
-        # Log the action
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            user_email=current_user.email,
-            action="start",
-            vm_id=vm_id,
-            vm_name=result["vm_name"],
-            success=result["success"],
-            error_message=None if result["success"] else result.get("message"),
-            ip_address=request.client.host if request.client else None
-        )
-        db.add(audit_log)
-        await db.commit()
-        
-        return VMActionResponse(**result)
     
     except Exception as e:
-        logger.error(f"Error starting VM {vm_id}: {e}")
+        logger.error("Error starting VM %s: %s", vm_id, e)
         
         # Log failed action
-        audit_log = AuditLog(
+        record_audit(
             user_id=current_user.id,
             user_email=current_user.email,
             action="start",
@@ -208,12 +182,28 @@ async def start_vm(
             vm_name=f"VM-{vm_id}",
             success=False,
             error_message=str(e),
-            ip_address=request.client.host if request.client else None
+            ip_address=client_ip(request)
         )
-        db.add(audit_log)
-        await db.commit()
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to start VM: {str(e)}"
         )
+    
+    # Outside the try: once Proxmox has accepted the command, nothing below
+    # may turn the request into a failure
+    record_audit(
+        user_id=current_user.id,
+        user_email=current_user.email,
+        action="start",
+        vm_id=vm_id,
+        vm_name=result["vm_name"],
+        success=result["success"],
+        error_message=None if result["success"] else result.get("message"),
+        ip_address=client_ip(request)
+    )
+    
+    if result["success"]:
+        await invalidate_vm_views()
+    
+    return VMActionResponse(**result)
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -65,11 +65,11 @@ class VMBase(BaseModel):
     vm_name: Optional[str] = None
 
 
-class VMStatus(BaseModel):
+class VMStatusDetail(BaseModel):
     """VM status schema"""
     vm_id: int
     vm_name: str
-    status: str  # running, stopped, paused
+    status: VMStatus
     uptime: Optional[int] = None  # seconds
     cpu: Optional[float] = None  # percentage
     memory: Optional[int] = None  # bytes
@@ -79,7 +79,7 @@ class VMResponse(BaseModel):
     """VM response with status"""
     vm_id: int
     vm_name: str
-    status: str
+    status: VMStatus = VMStatus.unknown
     uptime: Optional[int] = None
     assigned_user: Optional[str] = None  # Email of assigned user
     can_control: bool = True  # Whether current user can control this VM
@@ -128,6 +128,38 @@ class VMAssignmentResponse(BaseModel):
 
 # ============= Admin Schemas =============
 
+class PaginatedUsersResponse(BaseModel):
+    """One page of users"""
+    items: List[UserResponse]
+    total: int
+
+
+class PaginatedAssignmentsResponse(BaseModel):
+    """One page of VM assignments"""
+    items: List[VMAssignmentResponse]
+    total: int
+
+
+class AuditLogResponse(BaseModel):
+    """Audit log entry"""
+    id: int
+    user_email: str
+    action: str
+    vm_id: int
+    success: bool
+    details: Dict[str, Any]  # vm_name, error_message, ip_address when known
+    timestamp: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class AuditLogPageResponse(BaseModel):
+    """One page of audit log entries, newest first"""
+    items: List[AuditLogResponse]
+    next_before: Optional[int] = None  # Pass as ?before= for the next page
+
+
 class AdminStatsResponse(BaseModel):
     """Admin statistics response"""
     total_users: int
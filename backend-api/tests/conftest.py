@@ -0,0 +1,90 @@
+"""
+Shared test fixtures
+"""
+from typing import Dict, Optional
+import pytest
+from redis.exceptions import RedisError
+
+import app.auth
+import app.cache
+
+
+class FakeRedis:
+    """In-memory stand-in for the parts of redis.asyncio.Redis the app uses"""
+    
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+    
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+    
+    async def set(self, key: str, value, ex: Optional[int] = None, nx: bool = False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self._encode(value)
+        return True
+    
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+    
+    async def incr(self, key: str) -> int:
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = self._encode(value)
+        return value
+    
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues calls and runs them on execute(), like a redis pipeline"""
+    
+    def __init__(self, redis: FakeRedis):
+        self._redis = redis
+        self._calls = []
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._calls.clear()
+    
+    def incr(self, key: str):
+        self._calls.append((self._redis.incr, (key,)))
+    
+    async def execute(self):
+        return [await method(*args) for method, args in self._calls]
+
+
+class FailingRedis(FakeRedis):
+    """Redis that is down: every command raises RedisError"""
+    
+    async def get(self, key, *args, **kwargs):
+        raise RedisError("connection refused")
+    
+    set = delete = incr = get
+    
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch) -> FakeRedis:
+    """Replace the shared Redis client with an in-memory one"""
+    redis = FakeRedis()
+    monkeypatch.setattr(app.cache, "redis", redis)
+    monkeypatch.setattr(app.auth, "redis", redis)
+    return redis
+
+
+@pytest.fixture
+def failing_redis(monkeypatch) -> FailingRedis:
+    """Replace the shared Redis client with one that always fails"""
+    redis = FailingRedis()
+    monkeypatch.setattr(app.cache, "redis", redis)
+    monkeypatch.setattr(app.auth, "redis", redis)
+    return redis
@@ -0,0 +1,97 @@
+"""
+Tests for the batched audit log writer
+"""
+import asyncio
+import pytest
+
+import app.audit as audit
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """Capture batches instead of writing them to the database"""
+    batches = []
+    
+    async def write_batch(rows):
+        batches.append(rows)
+    
+    # A fresh queue per test; queues bind to the event loop that uses them
+    monkeypatch.setattr(audit, "audit_queue", asyncio.Queue())
+    monkeypatch.setattr(audit, "_write_batch", write_batch)
+    return batches
+
+
+def _record(vm_id: int, **details):
+    audit.record_audit(
+        user_id="u1",
+        user_email="u1@example.com",
+        action="start",
+        vm_id=vm_id,
+        success=True,
+        **details
+    )
+
+
+def test_record_audit_moves_extra_fields_into_details(written):
+    _record(101, vm_name="web", error_message=None, ip_address="10.0.0.1")
+    
+    row = audit.audit_queue.get_nowait()
+    assert row["vm_id"] == 101
+    assert row["details"] == {"vm_name": "web", "ip_address": "10.0.0.1"}
+    assert row["timestamp"].tzinfo is not None
+
+
+@pytest.mark.asyncio
+async def test_writer_splits_backlog_into_batches(written, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_BATCH_SIZE", 2)
+    for vm_id in range(5):
+        _record(vm_id)
+    
+    task = asyncio.create_task(audit.audit_writer())
+    await audit.stop_audit_writer(task)
+    
+    assert [len(batch) for batch in written] == [2, 2, 1]
+    assert [row["vm_id"] for batch in written for row in batch] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_partial_batch_after_interval(written):
+    task = asyncio.create_task(audit.audit_writer())
+    _record(101)
+    
+    await asyncio.sleep(audit.AUDIT_FLUSH_INTERVAL * 3)
+    assert [len(batch) for batch in written] == [1]
+    
+    await audit.stop_audit_writer(task)
+    assert task.done()
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_records(written):
+    task = asyncio.create_task(audit.audit_writer())
+    _record(101)
+    _record(102)
+    
+    await audit.stop_audit_writer(task)
+    
+    assert [row["vm_id"] for batch in written for row in batch] == [101, 102]
+    assert task.done()
+
+
+@pytest.mark.asyncio
+async def test_failing_record_does_not_drop_its_batch(monkeypatch):
+    inserted = []
+    attempts = []
+    
+    async def insert_rows(rows):
+        attempts.append(len(rows))
+        if any(row["vm_id"] == 3 for row in rows):
+            raise RuntimeError("foreign key violation")
+        inserted.extend(row["vm_id"] for row in rows)
+    
+    monkeypatch.setattr(audit, "_insert_rows", insert_rows)
+    
+    await audit._write_batch([{"vm_id": vm_id} for vm_id in range(8)])
+    
+    assert inserted == [0, 1, 2, 4, 5, 6, 7]
+    assert attempts[0] == 8
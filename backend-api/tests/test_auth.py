@@ -0,0 +1,112 @@
+"""
+Tests for token revocation and the VM access cache
+"""
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import app.auth as auth
+from app.auth import CurrentUser, session_auth_time
+
+REVOKED_AT = 1_700_000_000
+CREDENTIALS = HTTPAuthorizationCredentials(scheme="Bearer", credentials="token")
+
+
+class FakeSession:
+    """Answers the VM access query and counts how often it ran"""
+    
+    def __init__(self, allowed: bool):
+        self.allowed = allowed
+        self.queries = 0
+    
+    async def scalar(self, statement, params=None):
+        self.queries += 1
+        return self.allowed
+
+
+@pytest.fixture
+def revoked_user(monkeypatch):
+    """A cached user whose tokens were revoked at REVOKED_AT"""
+    user = CurrentUser(
+        id="u1", email="u1@example.com", is_admin=False, sso_jwt_version=REVOKED_AT
+    )
+    monkeypatch.setitem(auth._user_cache, user.id, user)
+    return user
+
+
+def _use_payload(monkeypatch, **claims):
+    async def verify_token(token):
+        return {"sub": "u1", "email": "u1@example.com", **claims}
+    
+    monkeypatch.setattr(auth.gotrue_client, "verify_token", verify_token)
+
+
+def test_session_auth_time_prefers_earliest_amr_timestamp():
+    payload = {
+        "iat": 300,
+        "amr": [{"method": "password", "timestamp": 200}, {"method": "totp", "timestamp": 250}],
+    }
+    assert session_auth_time(payload) == 200
+    assert session_auth_time({"iat": 300}) == 300
+    assert session_auth_time({"iat": 300, "amr": [{"method": "password"}]}) == 300
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("claims", [
+    {"iat": REVOKED_AT - 10},
+    {"iat": REVOKED_AT},  # Same second as the revoke
+    {"iat": REVOKED_AT + 60, "amr": [{"method": "password", "timestamp": REVOKED_AT - 10}]},
+])
+async def test_tokens_from_revoked_sessions_are_rejected(monkeypatch, revoked_user, claims):
+    _use_payload(monkeypatch, **claims)
+    
+    with pytest.raises(HTTPException) as exc_info:
+        await auth.get_current_user(credentials=CREDENTIALS, db=None)
+    
+    assert exc_info.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_sign_in_after_revoke_is_accepted(monkeypatch, revoked_user):
+    _use_payload(
+        monkeypatch,
+        iat=REVOKED_AT + 60,
+        amr=[{"method": "password", "timestamp": REVOKED_AT + 60}],
+    )
+    
+    assert await auth.get_current_user(credentials=CREDENTIALS, db=None) == revoked_user
+
+
+@pytest.mark.asyncio
+async def test_access_decision_is_cached_until_invalidated(fake_redis):
+    db = FakeSession(allowed=True)
+    
+    assert await auth.user_can_control("u1", 101, db) is True
+    db.allowed = False
+    assert await auth.user_can_control("u1", 101, db) is True
+    assert db.queries == 1
+    
+    await auth.invalidate_vm_access("u1", 101)
+    assert await auth.user_can_control("u1", 101, db) is False
+    assert db.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_denials_are_cached_per_user_and_vm(fake_redis):
+    db = FakeSession(allowed=False)
+    
+    assert await auth.user_can_control("u1", 101, db) is False
+    assert await auth.user_can_control("u1", 101, db) is False
+    assert await auth.user_can_control("u1", 102, db) is False
+    assert await auth.user_can_control("u2", 101, db) is False
+    assert db.queries == 3
+
+
+@pytest.mark.asyncio
+async def test_access_check_uses_database_when_redis_is_down(failing_redis):
+    db = FakeSession(allowed=True)
+    
+    assert await auth.user_can_control("u1", 101, db) is True
+    assert await auth.user_can_control("u1", 101, db) is True
+    assert db.queries == 2
+    await auth.invalidate_vm_access("u1", 101)  # Logged, not raised
@@ -0,0 +1,110 @@
+"""
+Tests for the Redis response cache
+"""
+import orjson
+import pytest
+from starlette.requests import Request
+
+from app.auth import CurrentUser
+from app.cache import (
+    VMS_NAMESPACE, cache_response, invalidate_vm_views, response_cache_key
+)
+
+ALICE = CurrentUser(id="alice", email="alice@example.com", is_admin=False)
+BOB = CurrentUser(id="bob", email="bob@example.com", is_admin=False)
+
+
+def _request(path: str = "/vms/", query: str = "") -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [],
+    })
+
+
+def _counting_endpoint(**options):
+    """A cached endpoint that returns how often it has actually run"""
+    calls = []
+    
+    @cache_response(expire=10, namespace=VMS_NAMESPACE, **options)
+    async def endpoint(request: Request, current_user: CurrentUser, fresh: bool = False):
+        calls.append(current_user.id)
+        return {"calls": len(calls)}
+    
+    return endpoint, calls
+
+
+def test_key_differs_per_user_role_path_query_and_version():
+    admin = CurrentUser(id="alice", email="alice@example.com", is_admin=True)
+    base = response_cache_key(VMS_NAMESPACE, 0, _request(), ALICE)
+    
+    assert base == response_cache_key(VMS_NAMESPACE, 0, _request(), ALICE)
+    assert len({
+        base,
+        response_cache_key(VMS_NAMESPACE, 0, _request(), BOB),
+        response_cache_key(VMS_NAMESPACE, 0, _request(), admin),
+        response_cache_key(VMS_NAMESPACE, 0, _request("/vms/101/status"), ALICE),
+        response_cache_key(VMS_NAMESPACE, 0, _request(query="fresh=true"), ALICE),
+        response_cache_key(VMS_NAMESPACE, 1, _request(), ALICE),
+    }) == 6
+
+
+@pytest.mark.asyncio
+async def test_repeated_request_is_served_from_cache(fake_redis):
+    endpoint, calls = _counting_endpoint()
+    
+    first = await endpoint(request=_request(), current_user=ALICE)
+    second = await endpoint(request=_request(), current_user=ALICE)
+    
+    assert calls == ["alice"]
+    assert orjson.loads(first.body) == orjson.loads(second.body) == {"calls": 1}
+    assert second.headers["cache-control"] == "max-age=10"
+
+
+@pytest.mark.asyncio
+async def test_users_do_not_share_entries(fake_redis):
+    endpoint, calls = _counting_endpoint()
+    
+    await endpoint(request=_request(), current_user=ALICE)
+    await endpoint(request=_request(), current_user=BOB)
+    
+    assert calls == ["alice", "bob"]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_makes_next_request_recompute(fake_redis):
+    endpoint, calls = _counting_endpoint()
+    
+    await endpoint(request=_request(), current_user=ALICE)
+    await invalidate_vm_views()
+    response = await endpoint(request=_request(), current_user=ALICE)
+    
+    assert len(calls) == 2
+    assert orjson.loads(response.body) == {"calls": 2}
+
+
+@pytest.mark.asyncio
+async def test_bypass_skips_cache(fake_redis):
+    endpoint, calls = _counting_endpoint(bypass=lambda kwargs: kwargs["fresh"])
+    
+    await endpoint(request=_request(query="fresh=true"), current_user=ALICE, fresh=True)
+    await endpoint(request=_request(query="fresh=true"), current_user=ALICE, fresh=True)
+    
+    assert len(calls) == 2
+    assert fake_redis.data == {}
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_falls_back_to_uncached(failing_redis):
+    endpoint, calls = _counting_endpoint()
+    
+    await endpoint(request=_request(), current_user=ALICE)
+    response = await endpoint(request=_request(), current_user=ALICE)
+    await invalidate_vm_views()  # Logged, not raised
+    
+    assert len(calls) == 2
+    assert orjson.loads(response.body) == {"calls": 2}
@@ -0,0 +1,43 @@
+"""
+Tests for client address resolution
+"""
+from starlette.requests import Request
+
+from app.config import settings
+from app.limiter import client_ip
+
+
+def _request(headers=(), client=("10.0.0.5", 1234)) -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/auth/login",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": client,
+    })
+
+
+def test_uses_peer_address_without_client_ip_header(monkeypatch):
+    monkeypatch.setattr(settings, "client_ip_header", "")
+    
+    request = _request(headers=[("CF-Connecting-IP", "203.0.113.7")])
+    
+    assert client_ip(request) == "10.0.0.5"
+
+
+def test_uses_configured_header_behind_edge_proxy(monkeypatch):
+    monkeypatch.setattr(settings, "client_ip_header", "CF-Connecting-IP")
+    
+    request = _request(headers=[
+        ("X-Forwarded-For", "198.51.100.1"),
+        ("CF-Connecting-IP", "203.0.113.7"),
+    ])
+    
+    assert client_ip(request) == "203.0.113.7"
+
+
+def test_falls_back_to_peer_address_when_header_missing(monkeypatch):
+    monkeypatch.setattr(settings, "client_ip_header", "CF-Connecting-IP")
+    
+    assert client_ip(_request()) == "10.0.0.5"
+    assert client_ip(_request(client=None)) is None